@@ -1,34 +1,50 @@
 import asyncio
+import functools
 import os
 import random
 import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from typing import List, Optional, Any, Dict
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 import logging
+import logging.handlers
+import multiprocessing
+import queue
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
-from stage3 import process_leads
-from supabase import create_client, Client
+import orjson
+from stage3 import build_prefix, process_lead, process_leads
+from realtime import RealtimeSubscribeStates
+from supabase import acreate_client, Client
+from supabase_client import LLM_WORKERS, MAX_CONCURRENCY, SUPABASE_KEY, SUPABASE_URL, get_supabase_client
 
-app = FastAPI(title="LLM Lead Processing API", version="0.1.0")
+app = FastAPI(
+    title="LLM Lead Processing API",
+    version="0.1.0",
+    default_response_class=ORJSONResponse,
+)
 
 # -------------------- CORS --------------------
 # Allow frontend (e.g., Vite dev server) to call this API.
-# Adjust origins list for production as needed.
-# ALLOWED_ORIGINS = [
-#     "http://localhost:5173",
-#     "http://127.0.0.1:5173",
-# ]
+# Set FRONTEND_ORIGIN (comma-separated) for production. Explicit origins are required with
+# allow_credentials (browsers reject "*"), and max_age lets browsers cache preflights.
+ALLOWED_ORIGINS = [
+    o.strip()
+    for o in os.getenv("FRONTEND_ORIGIN", "http://localhost:5173,http://127.0.0.1:5173").split(",")
+    if o.strip()
+]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["authorization", "content-type"],
+    max_age=86400,
 )
 
 # -------------------- Pydantic Schemas --------------------
@@ -46,12 +62,24 @@ class LeadIn(BaseModel):
     linkedin_url: Optional[str] = None
     company_page_url: Optional[str] = None
 
+# Keys forwarded to stage3 for each lead (same shape as LeadIn.model_dump())
+LEAD_FIELDS = tuple(LeadIn.model_fields)
+
+def _lead_payload(src: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: src.get(k) for k in LEAD_FIELDS}
+
+def _lead_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    # stage3 results have no "tag" (its dict is also the llm_response row); LeadResult documents it as null
+    result.setdefault("tag", None)
+    return result
+
 class ProcessRequest(BaseModel):
     api_key: str = Field(..., description="Gemini API key for this batch")
     wildnet_data: str = Field(..., description="WildnetEdge contextual/company data")
     scoring_criteria_and_icp: str = Field(..., description="Scoring criteria and ICP definition")
     message_prompt: str = Field(..., description="Prompt/instructions for outreach message generation")
-    leads: List[LeadIn] = Field(..., description="List of lead objects to process")
+    # Raw dicts (LeadIn shape) to avoid building a model per lead only to dump it again
+    leads: List[Dict[str, Any]] = Field(..., description="List of lead objects to process (LeadIn fields)")
 
 class LeadResult(BaseModel):
     lead_id: Optional[str]
@@ -92,18 +120,19 @@ async def process_leads_endpoint(payload: ProcessRequest):
     start = time.monotonic()
     errors: List[Dict[str, Any]] = []
 
-    # Run synchronous function in a thread (to avoid blocking event loop)
+    # Run synchronous function in the LLM executor (to avoid blocking event loop)
     loop = asyncio.get_event_loop()
     try:
         processed = await loop.run_in_executor(
-            None,
-            lambda: process_leads(
-                [l.model_dump() for l in payload.leads],
+            app.state.executor,
+            functools.partial(
+                process_leads,
+                [_lead_payload(l) for l in payload.leads],
                 payload.api_key,
                 payload.wildnet_data,
                 payload.scoring_criteria_and_icp,
-                payload.message_prompt
-            )
+                payload.message_prompt,
+            ),
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Processing failed: {e}")
@@ -111,7 +140,47 @@ async def process_leads_endpoint(payload: ProcessRequest):
     # processed already inserted into supabase inside process_leads; build response
     duration = time.monotonic() - start
     # No per-lead error capture currently beyond exceptions; extend here if needed
-    return ProcessResponse(results=processed, errors=errors, duration_sec=round(duration, 3))
+    # Results come from our own process_leads, so skip re-validating them: returning a Response
+    # bypasses response_model validation (the model still documents the schema in OpenAPI)
+    return ORJSONResponse(
+        {"results": [_lead_result(r) for r in processed], "errors": errors, "duration_sec": round(duration, 3)}
+    )
+
+@app.post("/process-leads/stream")
+async def process_leads_stream_endpoint(payload: ProcessRequest):
+    """Same contract as /process-leads, but streams one NDJSON line per lead as it completes.
+
+    Each line is a LeadResult object, or {"lead_id": ..., "error": ...} if that lead failed.
+    """
+    if not payload.leads:
+        raise HTTPException(status_code=400, detail="No leads provided")
+
+    loop = asyncio.get_event_loop()
+    prefix = build_prefix(payload.wildnet_data, payload.scoring_criteria_and_icp, payload.message_prompt)
+
+    async def gen():
+        # Leads run one at a time, as in process_leads, so a single API key isn't fanned out
+        for lead in payload.leads:
+            lead_payload = _lead_payload(lead)
+            try:
+                result = await loop.run_in_executor(
+                    app.state.executor,
+                    functools.partial(
+                        process_lead,
+                        lead_payload,
+                        payload.api_key,
+                        payload.wildnet_data,
+                        payload.scoring_criteria_and_icp,
+                        payload.message_prompt,
+                        prefix=prefix,
+                    ),
+                )
+                result = _lead_result(result)
+            except Exception as e:
+                result = {"lead_id": lead_payload.get("lead_id"), "error": f"Processing failed: {e}"}
+            yield orjson.dumps(result) + b"\n"
+
+    return StreamingResponse(gen(), media_type="application/x-ndjson")
 
 @app.post("/process-lead", response_model=ProcessSingleResponse)
 async def process_single_lead_endpoint(payload: ProcessSingleRequest):
@@ -124,8 +193,9 @@ async def process_single_lead_endpoint(payload: ProcessSingleRequest):
     loop = asyncio.get_event_loop()
     try:
         processed = await loop.run_in_executor(
-            None,
-            lambda: process_leads(
+            app.state.executor,
+            functools.partial(
+                process_leads,
                 [payload.lead.model_dump()],
                 payload.api_key,
                 payload.wildnet_data,
@@ -140,90 +210,114 @@ async def process_single_lead_endpoint(payload: ProcessSingleRequest):
         raise HTTPException(status_code=500, detail="Processing returned no result")
 
     duration = time.monotonic() - start
-    return ProcessSingleResponse(result=processed[0], errors=errors, duration_sec=round(duration, 3))
+    # Trusted internal result; see process_leads_endpoint for why this bypasses response_model
+    return ORJSONResponse(
+        {"result": _lead_result(processed[0]), "errors": errors, "duration_sec": round(duration, 3)}
+    )
 
 # -------------------- Background Worker --------------------
 
-# Env configuration
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-# Prefer service role if available, otherwise fall back to anon (RLS disabled per user, but safe default)
-SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-
+# Env configuration (SUPABASE_URL/KEY, MAX_CONCURRENCY and LLM_WORKERS come from supabase_client)
 POLL_INTERVAL_SEC = float(os.getenv("POLL_INTERVAL_SEC", "5"))
-MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", "3"))
+CLAIM_BATCH_SIZE = int(os.getenv("CLAIM_BATCH_SIZE", str(MAX_CONCURRENCY * 4)))
+# Claimed rows whose lease is older than this (worker crashed / killed) are re-claimed by the RPC
+CLAIM_LEASE_SEC = int(os.getenv("CLAIM_LEASE_SEC", "600"))
+# LLM executor: "thread" (default; process_leads is dominated by Gemini/Supabase HTTP waits, ~0.3 MB
+# per thread) or "process" (escapes the GIL if per-lead CPU ever dominates, ~20 MB per process)
+LLM_EXECUTOR = os.getenv("LLM_EXECUTOR", "thread").lower()
+LLM_PROCESSES = int(os.getenv("LLM_PROCESSES", str(os.cpu_count() or 1)))
+# Realtime push: wake the worker on lead_details changes; poll only as a heartbeat while subscribed
+REALTIME_ENABLED = os.getenv("REALTIME_ENABLED", "true").lower() in ("1", "true", "yes")
+REALTIME_HEARTBEAT_SEC = float(os.getenv("REALTIME_HEARTBEAT_SEC", "30"))
+API_KEYS_TTL_SEC = float(os.getenv("API_KEYS_TTL_SEC", "60"))
 LOG_FILE = os.getenv("LOG_FILE", os.path.join("logs", "processing.log"))
 
 # Configure append-only file logging with IST timestamps embedded in the message
 os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
 _worker_logger = logging.getLogger("llm_worker")
 _worker_logger.setLevel(logging.INFO)
+_log_listener: Optional[logging.handlers.QueueListener] = None
 if not _worker_logger.handlers:
     # File handler
     _fh = logging.FileHandler(LOG_FILE, mode="a", encoding="utf-8")
     _fh.setFormatter(logging.Formatter("%(message)s"))
-    _worker_logger.addHandler(_fh)
-    
+
     # Console handler (also logs to stdout/docker logs)
     _ch = logging.StreamHandler()
     _ch.setFormatter(logging.Formatter("%(message)s"))
-    _worker_logger.addHandler(_ch)
+
+    # Emit via a queue so file/console writes happen on a background thread, not the event loop
+    _log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    _worker_logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+    _log_listener = logging.handlers.QueueListener(_log_queue, _fh, _ch, respect_handler_level=True)
+    _log_listener.start()
+app.state.log_listener = _log_listener
+
+_IST = ZoneInfo("Asia/Kolkata")
 
 def _ist_now_str() -> str:
-    return datetime.now(ZoneInfo("Asia/Kolkata")).strftime("%Y-%m-%d %H:%M:%S %Z")
+    # IST has a fixed +05:30 offset, so the zone name is a literal rather than %Z
+    return datetime.now(_IST).strftime("%Y-%m-%d %H:%M:%S IST")
 
-def _make_supabase_client() -> Client:
-    key = SUPABASE_SERVICE_ROLE_KEY or SUPABASE_ANON_KEY
-    if not SUPABASE_URL or not key:
-        raise RuntimeError("Missing SUPABASE_URL or SUPABASE_*_KEY env for background worker")
-    return create_client(SUPABASE_URL, key)
+async def _sb_execute(query) -> Any:
+    """Run a supabase-py query builder's blocking .execute() off the event loop."""
+    return await asyncio.to_thread(query.execute)
+
+# In-process cache of gemini_api keys, refreshed every API_KEYS_TTL_SEC
+_API_KEYS: List[str] = []
+_API_KEYS_EXPIRY: float = 0.0
+_API_KEYS_LOCK = asyncio.Lock()
 
 async def _pick_random_api_key(sb: Client) -> Optional[str]:
-    try:
-        resp = sb.table("gemini_api").select("api_key").execute()
-        rows = resp.data or []
-        if not rows:
-            return None
-        return random.choice(rows).get("api_key")
-    except Exception:
+    global _API_KEYS, _API_KEYS_EXPIRY
+    if time.monotonic() > _API_KEYS_EXPIRY:
+        async with _API_KEYS_LOCK:
+            # Another task may have refreshed while we waited for the lock
+            if time.monotonic() > _API_KEYS_EXPIRY:
+                try:
+                    resp = await _sb_execute(sb.table("gemini_api").select("api_key"))
+                    _API_KEYS = [r.get("api_key") for r in (resp.data or []) if r.get("api_key")]
+                    _API_KEYS_EXPIRY = time.monotonic() + API_KEYS_TTL_SEC
+                except Exception:
+                    # Keep serving the stale list (if any); retry on next call
+                    pass
+    if not _API_KEYS:
         return None
+    return random.choice(_API_KEYS)
 
-def _lead_already_processed(sb: Client, lead_id: Optional[str]) -> bool:
-    if not lead_id:
-        return False
+async def _settle_claims(sb: Client, lead_ids: List[str], values: Dict[str, Any], action: str) -> None:
+    """Apply one batched lead_details update to claimed leads; failures are logged, the lease covers them."""
+    if not lead_ids:
+        return
     try:
-        resp = sb.table("llm_response").select("lead_id").eq("lead_id", lead_id).limit(1).execute()
-        data = resp.data or []
-        return len(data) > 0
+        await _sb_execute(sb.table("lead_details").update(values).in_("lead_id", lead_ids))
     except Exception:
-        return False
+        _worker_logger.exception(
+            f"{_ist_now_str()} | CLAIM | {action} failed, rows wait for lease expiry ({CLAIM_LEASE_SEC}s) | lead_ids={lead_ids}"
+        )
+
+async def _release_claims(sb: Client, lead_ids: List[str]) -> None:
+    """Reset sent_to_llm for claimed leads that were not processed so the next cycle retries them."""
+    await _settle_claims(sb, lead_ids, {"sent_to_llm": False, "claimed_at": None}, "release")
+
+async def _finish_claims(sb: Client, lead_ids: List[str]) -> None:
+    """Clear the lease on processed leads (sent_to_llm stays true)."""
+    await _settle_claims(sb, lead_ids, {"claimed_at": None}, "finish")
 
 async def _process_row(row: Dict[str, Any], api_key: str) -> None:
     """Process a single joined row from RPC using stage3.process_leads in a thread."""
-    lead_payload = {
-        "lead_id": row.get("lead_id"),
-        "tag": row.get("tag"),
-        "name": row.get("name"),
-        "title": row.get("title"),
-        "location": row.get("location"),
-        "company_name": row.get("company_name"),
-        "experience": row.get("experience"),
-        "skills": row.get("skills"),
-        "bio": row.get("bio"),
-        "profile_url": row.get("profile_url"),
-        "linkedin_url": row.get("linkedin_url"),
-        "company_page_url": row.get("company_page_url"),
-    }
+    lead_payload = _lead_payload(row)
 
     wildnet_data = row.get("wildnet_data")
     scoring_criteria_and_icp = row.get("scoring_criteria_and_icp")
     message_prompt = row.get("message_prompt")
 
     loop = asyncio.get_event_loop()
-    # Use thread to avoid blocking the event loop; stage3.process_leads is sync
+    # Run off the event loop; stage3.process_leads is sync
     await loop.run_in_executor(
-        None,
-        lambda: process_leads(
+        app.state.executor,
+        functools.partial(
+            process_leads,
             [lead_payload],
             api_key,
             wildnet_data,
@@ -232,43 +326,117 @@ async def _process_row(row: Dict[str, Any], api_key: str) -> None:
         ),
     )
 
+MAX_BACKOFF_SEC = 60.0
+
+async def _sleep_backoff(backoff: float) -> float:
+    """Sleep for a jittered backoff and return the next (doubled, capped) backoff."""
+    await asyncio.sleep(min(MAX_BACKOFF_SEC, backoff) + random.uniform(0, backoff * 0.3))
+    return min(MAX_BACKOFF_SEC, backoff * 2)
+
+# Set by realtime events (or on resubscribe) to trigger an immediate RPC poll
+_wakeup = asyncio.Event()
+_realtime_connected = False
+
+async def _wait_for_work() -> None:
+    """Sleep until a realtime wake-up or the poll/heartbeat interval, whichever comes first."""
+    timeout = REALTIME_HEARTBEAT_SEC if _realtime_connected else POLL_INTERVAL_SEC
+    try:
+        await asyncio.wait_for(_wakeup.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    _wakeup.clear()
+
+def _on_lead_change(payload: Dict[str, Any]) -> None:
+    """Wake the worker for any lead_details change that may be pending.
+
+    Filtered here rather than with a server-side sent_to_llm=eq.false filter, which would miss rows
+    inserted with sent_to_llm NULL (the claim RPC treats NULL as pending). Unknown payload shapes wake.
+    """
+    data = payload.get("data") or payload
+    record = data.get("record") or data.get("new") or {}
+    if record.get("sent_to_llm") is not True:
+        _wakeup.set()
+
+async def _realtime_listener() -> None:
+    """Subscribe to pending lead_details changes; reconnect with jittered exponential backoff."""
+    global _realtime_connected
+    backoff = 1.0
+    # One AsyncClient for the listener's lifetime; reconnects only recreate the channel
+    asb = None
+
+    while True:
+        lost = asyncio.Event()
+
+        def _on_status(status: RealtimeSubscribeStates, err: Optional[Exception] = None) -> None:
+            global _realtime_connected
+            nonlocal backoff
+            if status == RealtimeSubscribeStates.SUBSCRIBED:
+                _realtime_connected = True
+                backoff = 1.0
+                # Catch up on anything that arrived while we were disconnected
+                _wakeup.set()
+                print(f"{_ist_now_str()} | RTIME | subscribed to lead_details")
+            else:
+                _realtime_connected = False
+                lost.set()
+                print(f"{_ist_now_str()} | RTIME | status={status} err={err}")
+
+        try:
+            if asb is None:
+                asb = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+            channel = asb.channel("llm-pending-leads")
+            for event in ("INSERT", "UPDATE"):
+                channel.on_postgres_changes(
+                    event,
+                    schema="public",
+                    table="lead_details",
+                    callback=_on_lead_change,
+                )
+            await channel.subscribe(_on_status)
+            await lost.wait()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"{_ist_now_str()} | RTIME | subscribe failed: {e}")
+        finally:
+            _realtime_connected = False
+            if asb is not None:
+                try:
+                    await asb.remove_all_channels()
+                except Exception:
+                    pass
+
+        # Worker falls back to POLL_INTERVAL_SEC polling until we resubscribe
+        backoff = await _sleep_backoff(backoff)
+
 async def _worker_loop():
-    sb = _make_supabase_client()
+    sb = get_supabase_client()
     sem = asyncio.Semaphore(MAX_CONCURRENCY)
+    # Grows on consecutive failures (e.g. Supabase outage / 429) so replicas don't retry in lockstep
+    backoff = POLL_INTERVAL_SEC
 
     while True:
         try:
             cycle_start = time.monotonic()
-            # Fetch eligible rows via RPC (v2 driven by lead_details.sent_to_llm=false)
-            rpc_name = "rpc_get_eligible_llm_jobs_v2"
-            resp = sb.rpc(rpc_name, {}).execute()
+            # Claim eligible rows via RPC: marks sent_to_llm=true + claimed_at=now() and returns them in
+            # one call; leads that already have an llm_response are marked but not returned
+            rpc_name = "rpc_claim_llm_jobs_v2"
+            resp = await _sb_execute(
+                sb.rpc(rpc_name, {"batch_size": CLAIM_BATCH_SIZE, "lease_seconds": CLAIM_LEASE_SEC})
+            )
             rows = resp.data or []
+            backoff = POLL_INTERVAL_SEC
 
             if not rows:
                 duration = time.monotonic() - cycle_start
                 print(f"{_ist_now_str()} | CYCLE | total=0, processed=0, skipped=0, errors=0, duration={duration:.2f}s")
-                await asyncio.sleep(POLL_INTERVAL_SEC)
+                await _wait_for_work()
                 continue
 
-            tasks = []
-            for row in rows:
-                await sem.acquire()
-
-                async def _run(row=row):  # capture row by value
+            async def _run(row: Dict[str, Any]) -> str:
+                async with sem:
                     api_key_local: Optional[str] = None
                     try:
-                        # Idempotency guard: if already has a response, mark sent_to_llm and skip
-                        lead_id = row.get('lead_id')
-                        if _lead_already_processed(sb, lead_id):
-                            try:
-                                sb.table("lead_details").update({"sent_to_llm": True}).eq("lead_id", lead_id).execute()
-                            except Exception:
-                                pass
-                            _worker_logger.info(
-                                f"{_ist_now_str()} | SKIP  | lead_id={lead_id} | name={row.get('name')} | reason=already_processed"
-                            )
-                            return "skipped"
-
                         # Pick random API key per lead
                         api_key_local = await _pick_random_api_key(sb)
                         if not api_key_local:
@@ -284,24 +452,30 @@ async def _worker_loop():
                         )
                         return "processed"
                     except Exception:
-                        # Swallow and continue; rely on sent_to_llm flag to retry next loop
+                        # Swallow and continue; the claim is released below so the next loop retries
                         _worker_logger.exception(
                             f"{_ist_now_str()} | ERROR | lead_id={row.get('lead_id')} | name={row.get('name')} | api_key={api_key_local}"
                         )
                         return "error"
-                    finally:
-                        sem.release()
-
-                tasks.append(asyncio.create_task(_run()))
 
+            # Schedule every row up-front; the semaphore inside _run bounds concurrency.
             # Wait for this batch to finish before next poll to avoid hammering
-            if tasks:
-                results = await asyncio.gather(*tasks)
-                processed_count = sum(1 for r in results if r == "processed")
-                skipped_count = sum(1 for r in results if r in ("skipped", "no_key"))
-                error_count = sum(1 for r in results if r == "error")
-            else:
-                processed_count = skipped_count = error_count = 0
+            tasks = [asyncio.create_task(_run(row)) for row in rows]
+            try:
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+            finally:
+                # Also runs when the worker is cancelled (shutdown): hand back every claim that didn't
+                # finish. Claims lost to a hard kill are re-claimed once their lease expires.
+                finished = [
+                    t.done() and not t.cancelled() and t.exception() is None and t.result() == "processed"
+                    for t in tasks
+                ]
+                ids = [(row.get("lead_id"), ok) for row, ok in zip(rows, finished) if row.get("lead_id")]
+                await _finish_claims(sb, [lid for lid, ok in ids if ok])
+                await _release_claims(sb, [lid for lid, ok in ids if not ok])
+            processed_count = sum(1 for r in results if r == "processed")
+            skipped_count = sum(1 for r in results if r == "no_key")
+            error_count = sum(1 for r in results if r == "error" or isinstance(r, BaseException))
 
             # small pause between batches
             await asyncio.sleep(0.1)
@@ -312,27 +486,51 @@ async def _worker_loop():
             print(
                 f"{_ist_now_str()} | CYCLE | total={total}, processed={processed_count}, skipped={skipped_count}, errors={error_count}, duration={duration:.2f}s"
             )
-        except Exception:
-            # Avoid crashing the loop on transient issues
-            await asyncio.sleep(POLL_INTERVAL_SEC)
+        except Exception as e:
+            # Avoid crashing the loop on transient issues; back off with jitter until Supabase recovers
+            print(f"{_ist_now_str()} | CYCLE | error={e!r}, retry_in~{min(MAX_BACKOFF_SEC, backoff):.1f}s")
+            backoff = await _sleep_backoff(backoff)
 
 
 @app.on_event("startup")
 async def _on_startup():
+    # Dedicated, bounded thread pool; serves asyncio.to_thread (Supabase calls) and, by default, LLM work
+    threads = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm")
+    asyncio.get_running_loop().set_default_executor(threads)
+    app.state.threads = threads
+    executor: Executor = threads
+    if LLM_EXECUTOR == "process":
+        # spawn, not fork: by now the process runs the log listener, thread pool and HTTPX pool
+        # locks, and forking a threaded process can deadlock the child
+        executor = ProcessPoolExecutor(max_workers=LLM_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+    app.state.executor = executor
     # Start background worker
     app.state.worker = asyncio.create_task(_worker_loop())
+    if REALTIME_ENABLED:
+        app.state.realtime = asyncio.create_task(_realtime_listener())
 
 
 @app.on_event("shutdown")
 async def _on_shutdown():
-    # Cancel background worker if running
-    worker = getattr(app.state, "worker", None)
-    if worker:
-        worker.cancel()
-        try:
-            await worker
-        except Exception:
-            pass
+    # Cancel background worker and realtime listener if running
+    for name in ("worker", "realtime"):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    for name in ("executor", "threads"):
+        executor = getattr(app.state, name, None)
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    # Drain queued log records to file/console
+    log_listener = getattr(app.state, "log_listener", None)
+    if log_listener:
+        log_listener.stop()
 
 @app.get("/health")
 async def health():
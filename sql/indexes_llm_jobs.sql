@@ -0,0 +1,35 @@
+-- Indexes backing the worker's claim RPC.
+-- Run once in the Supabase SQL editor. CONCURRENTLY avoids locking writes but cannot
+-- run inside a transaction block, so execute each statement on its own.
+--
+-- llm_response.lead_id and all_leads.lead_id are primary keys, so their PK indexes already
+-- serve "not exists (select 1 from llm_response where lead_id = ...)" and the
+-- lead_details -> all_leads join; no extra indexes are needed there.
+--
+--   lead_details_pending_idx : partial index over unprocessed leads only, so finding
+--                              sent_to_llm=false rows stays cheap as lead_details grows.
+--                              The predicate mirrors the RPCs' coalesce(...) filter exactly,
+--                              otherwise the planner cannot use a partial index.
+--   lead_details_claimed_idx : claims with an open lease (small: cleared on finish/release),
+--                              used to find expired leases in rpc_claim_llm_jobs_v2
+--   prompts_user_tag_created_idx : "distinct on (user_id, tag) ... order by created_at desc"
+
+create index concurrently if not exists lead_details_pending_idx
+  on public.lead_details (lead_id)
+  where coalesce(sent_to_llm, false) = false;
+
+create index concurrently if not exists lead_details_claimed_idx
+  on public.lead_details (claimed_at)
+  where claimed_at is not null;
+
+create index concurrently if not exists prompts_user_tag_created_idx
+  on public.prompts (user_id, tag, created_at desc);
+
+-- Verify the planner uses them (expect Index Scan / Bitmap Index Scan, not Seq Scan).
+-- EXPLAIN on the function call hides its body, so explain the eligibility query directly:
+-- explain analyze
+--   select ld.lead_id from public.lead_details ld
+--   join public.all_leads al on al.lead_id = ld.lead_id
+--   where coalesce(ld.sent_to_llm, false) = false
+--     and not exists (select 1 from public.llm_response r where r.lead_id = ld.lead_id)
+--   limit 50;
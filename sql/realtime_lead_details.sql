@@ -0,0 +1,5 @@
+-- Enables Supabase Realtime (Postgres changes) on lead_details so the background
+-- worker is woken as soon as a lead with sent_to_llm=false is inserted/updated.
+-- Without this the worker still works, falling back to polling every POLL_INTERVAL_SEC.
+
+alter publication supabase_realtime add table public.lead_details;
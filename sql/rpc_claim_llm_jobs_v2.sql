@@ -0,0 +1,94 @@
+-- Claims up to batch_size eligible leads in one round-trip and returns them with prompt context.
+-- Same eligibility/join as rpc_get_eligible_llm_jobs_v2, but:
+--   * rows are marked lead_details.sent_to_llm = true atomically (UPDATE ... RETURNING)
+--   * FOR UPDATE SKIP LOCKED lets several workers claim concurrently without double-processing
+--   * leads that already have an llm_response are marked but not returned (idempotency guard)
+--   * each claim is a lease: claimed_at = now(). Rows still claimed after lease_seconds with no
+--     llm_response (worker killed mid-batch, failed release) are claimed again.
+-- The worker clears claimed_at for leads it processed, and resets sent_to_llm = false (and
+-- claimed_at) for leads it fails to process so they are retried on the next cycle.
+
+alter table public.lead_details add column if not exists claimed_at timestamptz;
+
+-- Replaces the earlier single-argument version (avoids an ambiguous overload)
+drop function if exists public.rpc_claim_llm_jobs_v2(int);
+
+create or replace function public.rpc_claim_llm_jobs_v2(batch_size int default 50, lease_seconds int default 600)
+returns table (
+  lead_id text,
+  user_id uuid,
+  tag text,
+  name text,
+  title text,
+  location text,
+  company_name text,
+  experience text,
+  skills text,
+  bio text,
+  profile_url text,
+  linkedin_url text,
+  company_page_url text,
+  wildnet_data text,
+  scoring_criteria_and_icp text,
+  message_prompt text
+)
+language sql
+volatile
+as $$
+  with claimed as (
+    update public.lead_details ld
+    set sent_to_llm = true,
+        -- no lease needed for leads that already have a response
+        claimed_at = case
+          when exists (select 1 from public.llm_response r where r.lead_id = ld.lead_id) then null
+          else now()
+        end
+    where ld.lead_id in (
+      select c.lead_id
+      from public.lead_details c
+      join public.all_leads al on al.lead_id = c.lead_id
+      where (
+          coalesce(c.sent_to_llm, false) = false
+          or (
+            c.claimed_at < now() - make_interval(secs => lease_seconds)
+            and not exists (select 1 from public.llm_response r where r.lead_id = c.lead_id)
+          )
+        )
+        and exists (
+          select 1 from public.prompts p
+          where p.user_id = al.user_id and p.tag = al.tag
+        )
+      limit batch_size
+      for update of c skip locked
+    )
+    returning ld.*
+  )
+  select
+    ld.lead_id,
+    al.user_id,
+    al.tag,
+    ld.name,
+    ld.title,
+    ld.location,
+    ld.company_name,
+    ld.experience,
+    ld.skills,
+    ld.bio,
+    ld.profile_url,
+    coalesce(al.linkedin_url, ld.profile_url) as linkedin_url,
+    ld.company_page_url,
+    p.wildnet_data,
+    p.scoring_criteria_and_icp,
+    p.message_prompt
+  from claimed ld
+  join public.all_leads al on al.lead_id = ld.lead_id
+  join (
+      select distinct on (user_id, tag)
+        user_id, tag, wildnet_data, scoring_criteria_and_icp, message_prompt, created_at
+      from public.prompts
+      order by user_id, tag, created_at desc
+  ) p on p.user_id = al.user_id and p.tag = al.tag
+  where not exists (
+    select 1 from public.llm_response r where r.lead_id = ld.lead_id
+  );
+$$;
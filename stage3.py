@@ -1,22 +1,20 @@
-import os
 import json
+from typing import Optional
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain.output_parsers import PydanticOutputParser
-# make a supabase client if needed
-from supabase import create_client, Client
+from supabase import Client
+# Shared client/pool (same instance the app's background worker uses)
+from supabase_client import get_supabase_client
 
 
 
 load_dotenv()
 
 
-supabase_url = os.getenv("SUPABASE_URL")
-# Prefer service role for server-side actions (RLS may be disabled but safe)
-supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_ANON_KEY")
-supabase: Client = create_client(supabase_url, supabase_key)
+supabase: Client = get_supabase_client()
 
 # ----- Schemas -----
 class GeminiScoreResponse(BaseModel):
@@ -32,30 +30,57 @@ class GeminiMessageResponse(BaseModel):
 # with open("stages/wildnetEdge.txt", "r") as f:
 #     wildnet_edge_data = f.read()
 
+# Parsers and their format instructions are static; build them once at import
+score_parser = PydanticOutputParser(pydantic_object=GeminiScoreResponse)
+SCORE_FORMAT = score_parser.get_format_instructions()
+msg_parser = PydanticOutputParser(pydantic_object=GeminiMessageResponse)
+MSG_FORMAT = msg_parser.get_format_instructions()
+
+# ----- Shared prompt prefix -----
+def build_prefix(wildnet_data, scoring_criteria_and_ICP, message_prompt) -> dict:
+    """
+    Build the lead-independent system messages once per batch.
+    They depend only on the company context and prompts, which are identical for every lead in a call.
+    """
+    scoring_system_msg = SystemMessage(content=f"""
+You are an expert lead qualifier. We (WildnetEdge) as a company offer the following services to our clients:
+WildnetEdge: ```{wildnet_data}```
+
+Scoring criteria and ICP:
+```{scoring_criteria_and_ICP}```
+""")
+
+    # Using same wildnet_edge_data context; (original message.py prompt body not provided, keep minimal)
+    message_system = SystemMessage(content=f"""
+You are an expert SDR crafting concise personalized outreach.
+Company context (WildnetEdge services):
+```{wildnet_data}```
+
+Message prompt:
+```{message_prompt}```
+""")
+
+    return {"scoring_system_msg": scoring_system_msg, "message_system": message_system}
+
 # ----- Core function -----
-def process_lead(lead_info: dict, api_key: str, wildnet_data, scoring_criteria_and_ICP, message_prompt) -> dict:
+def process_lead(lead_info: dict, api_key: str, wildnet_data, scoring_criteria_and_ICP, message_prompt, prefix: Optional[dict] = None) -> dict:
     """
     1. Score lead (GeminiScoreResponse) using existing scoring prompt (unchanged).
     2. If score >= 50 generate SUBJECT + MESSAGE (GeminiMessageResponse).
        Else set both to 'ineligible'.
     3. Return required fields.
+    Pass `prefix` (from build_prefix) to reuse the shared system messages across a batch.
     """
+    if prefix is None:
+        prefix = build_prefix(wildnet_data, scoring_criteria_and_ICP, message_prompt)
+
     # -------- Scoring Phase (prompt kept exactly as in stage3.py) --------
     scoring_llm = ChatGoogleGenerativeAI(
         model='models/gemini-2.5-flash',
         google_api_key=api_key,
         temperature=0.3
     )
-    score_parser = PydanticOutputParser(pydantic_object=GeminiScoreResponse)
-    score_format = score_parser.get_format_instructions()
-
-    scoring_system_msg = SystemMessage(content=f"""
-You are an expert lead qualifier. We (WildnetEdge) as a company offer the following services to our clients:
-WildnetEdge: ```{wildnet_data}```
-
-Scoring criteria and ICP:
-```{scoring_criteria_and_ICP}```
-""")
+    scoring_system_msg = prefix["scoring_system_msg"]
 
     scoring_human_msg = HumanMessage(content=f"""
 Evaluate this lead for potential:
@@ -63,7 +88,7 @@ Lead Info: ```{lead_info}```
 
 Should we approach this lead? Score the leads based on above rule (0-100) and explain your reasoning and lead's location based on how well they match our services. Keep the score criteria strict and give high score only to those who fulfill all the criteria to a good extent.
 
-Score format: ```{score_format}```
+Score format: ```{SCORE_FORMAT}```
 """)
 
     score_raw = scoring_llm.invoke([scoring_system_msg, scoring_human_msg])
@@ -80,25 +105,14 @@ Score format: ```{score_format}```
             google_api_key=api_key,
             temperature=0.6
         )
-        msg_parser = PydanticOutputParser(pydantic_object=GeminiMessageResponse)
-        msg_format = msg_parser.get_format_instructions()
-
-        # Using same wildnet_edge_data context; (original message.py prompt body not provided, keep minimal)
-        message_system = SystemMessage(content=f"""
-You are an expert SDR crafting concise personalized outreach.
-Company context (WildnetEdge services):
-```{wildnet_data}```
-
-Message prompt:
-```{message_prompt}```
-""")
+        message_system = prefix["message_system"]
 
         message_human = HumanMessage(content=f"""
 Lead info:
 {lead_info}
 
 Generate outreach.
-{msg_format}
+{MSG_FORMAT}
 """)
 
         msg_raw = msg_llm.invoke([message_system, message_human])
@@ -146,9 +160,11 @@ Generate outreach.
 # # Optional batch helper
 def process_leads(leads, api_key: str, wildnet_data, scoring_criteria_and_ICP, message_prompt):
     llm_responses = []
+    # Context/prompts are the same for every lead in the batch; build the system messages once
+    prefix = build_prefix(wildnet_data, scoring_criteria_and_ICP, message_prompt)
     for ld in leads:
         print(f"Processing lead {ld.get('lead_id')} - {ld.get('name')}")
-        result = process_lead(ld, api_key, wildnet_data, scoring_criteria_and_ICP, message_prompt)
+        result = process_lead(ld, api_key, wildnet_data, scoring_criteria_and_ICP, message_prompt, prefix=prefix)
         if result:
             llm_responses.append(result)
         else:
@@ -0,0 +1,45 @@
+import os
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+from supabase import create_client, Client, ClientOptions
+
+load_dotenv()
+
+# Single source for Supabase/pool settings; app.py imports these rather than re-reading the env
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+# Prefer service role for server-side actions (RLS may be disabled but safe)
+SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_ANON_KEY")
+
+# Max concurrent worker jobs and LLM thread-pool size; the HTTPX pool is sized from both so
+# neither the worker tasks nor the LLM threads (stage3 writes) wait on a connection
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", "3"))
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "64"))
+
+# Shared Supabase client (one keep-alive connection pool per process)
+_SB: Optional[Client] = None
+
+def get_supabase_client() -> Client:
+    """Return the process-wide Supabase client, creating it (and its HTTPX pool) on first use."""
+    global _SB
+    if _SB is not None:
+        return _SB
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise RuntimeError("Missing SUPABASE_URL or SUPABASE_*_KEY env")
+    http = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=max(64, MAX_CONCURRENCY * 2, LLM_WORKERS),
+            max_keepalive_connections=max(32, MAX_CONCURRENCY, LLM_WORKERS // 2),
+            keepalive_expiry=60,
+        ),
+        timeout=httpx.Timeout(60.0),
+    )
+    try:
+        options = ClientOptions(httpx_client=http)
+    except TypeError:
+        # Older supabase-py without httpx_client injection; fall back to its own pool
+        http.close()
+        options = ClientOptions()
+    _SB = create_client(SUPABASE_URL, SUPABASE_KEY, options=options)
+    return _SB